@@ -1,6 +1,18 @@
+import re
+from struct import pack
+
 from routeros.exc import TrapError
 
 
+# Bytes that must be escaped inside a JSON string.
+JSON_ESCAPE = re.compile(b'[\\x00-\\x1f"\\\\]')
+JSON_ESCAPES = dict(
+    (pack('B', byte), '\\u{0:04x}'.format(byte).encode('ascii')) for byte in range(0x20)
+)
+JSON_ESCAPES.update({b'"': b'\\"', b'\\': b'\\\\'})
+NON_ASCII = re.compile(b'[\\x80-\\xff]')
+
+
 class Parser:
     @staticmethod
     def parse_word(word):
@@ -22,6 +34,58 @@ class Parser:
         '''
         return '={0}={1}'.format(key, value)
 
+    @staticmethod
+    def parse_raw_word(word):
+        '''
+        Locate key and value in a raw (undecoded) attribute word,
+        without copying it.
+
+        :param word: API word as bytes.
+        :returns: memoryview of word, key start offset, separator offset.
+                  Key is view[start:separator], value is view[separator + 1:].
+        '''
+        start = 1 if word[:1] == b'=' else 0
+        separator = word.find(b'=', start)
+        if separator == -1:
+            separator = len(word)
+        return memoryview(word), start, separator
+
+    @staticmethod
+    def dump_json_line(words, encoding='utf-8'):
+        '''
+        Serialize raw attribute words straight to a UTF-8 JSON object line.
+
+        :param words: Words as returned by parse_raw_word.
+        :param encoding: encoding of words.
+        :returns: bytes with a JSON object terminated by a newline.
+        '''
+        line = bytearray(b'{')
+        for view, start, separator in words:
+            if len(line) > 1:
+                line += b','
+            line += b'"'
+            line += escape_json(view[start:separator], encoding)
+            line += b'":"'
+            line += escape_json(view[separator + 1:], encoding)
+            line += b'"'
+        line += b'}\n'
+        return bytes(line)
+
+
+def escape_json(chunk, encoding):
+    """
+    Escape a bytes-like chunk for use inside a JSON string.
+    Chunks with non ASCII bytes are transcoded from encoding to UTF-8,
+    plain ASCII chunks with nothing to escape are returned untouched.
+
+    :throws UnicodeDecodeError: If chunk is not valid in given encoding.
+    """
+    if NON_ASCII.search(chunk) is not None:
+        chunk = bytes(chunk).decode(encoding=encoding, errors='strict').encode('utf-8')
+    if JSON_ESCAPE.search(chunk) is None:
+        return chunk
+    return JSON_ESCAPE.sub(lambda match: JSON_ESCAPES[match.group()], chunk)
+
 
 class Query:
     def __init__(self, api, command):
@@ -52,6 +116,8 @@ class Query:
 class RouterOS(Parser):
     def __init__(self, protocol):
         self.protocol = protocol
+        # Raw command whose response is not read up to !done yet.
+        self.raw_response = None
 
     def __call__(self, command, *args, **kwargs):
         """
@@ -64,9 +130,50 @@ class RouterOS(Parser):
         if kwargs:
             args = tuple(self.compose_word(key, value) for key, value in kwargs.items())
 
+        self._close_raw_response()
         self.protocol.write_sentence(command, *args)
         return self._read_response()
 
+    def raw(self, command, *args, **kwargs):
+        """
+        Call Api with given command, without decoding the response.
+
+        :param command: Command word. eg. /ip/address/print
+        :param args: List with optional arguments, most used for query commands.
+        :param kwargs: Dictionary with optional arguments.
+        :returns: Generator of reply word, tuple with parsed raw words,
+                  for every sentence up to and including !done.
+                  Sentences left unread are drained before the next command
+                  is written, the generator then stops.
+        """
+        if kwargs:
+            args = tuple(self.compose_word(key, value) for key, value in kwargs.items())
+
+        self._close_raw_response()
+        self.protocol.write_sentence(command, *args)
+        self.raw_response = response = object()
+        return self._read_raw_response(response)
+
+    def raw_json(self, command, *args, **kwargs):
+        """
+        Call Api with given command and serialize every returned row to JSON.
+        Words are transcoded from protocol encoding to UTF-8.
+
+        :throws TrapError: If !trap is received, once response is read up to !done.
+        :returns: Generator of JSON lines (bytes), one for each !re sentence.
+        """
+        message = None
+        for reply_word, words in self.raw(command, *args, **kwargs):
+            if reply_word == b'!re':
+                yield self.dump_json_line(words, self.protocol.encoding)
+            elif reply_word == b'!trap':
+                message = b''
+                for view, start, separator in words:
+                    if view[start:separator] == b'message':
+                        message = view[separator + 1:].tobytes()
+        if message is not None:
+            raise TrapError(message.decode(encoding=self.protocol.encoding, errors='replace'))
+
     def query(self, command):
         return Query(self, command)
 
@@ -80,6 +187,36 @@ class RouterOS(Parser):
         words = dict(self.parse_word(word) for word in words)
         return reply_word, words
 
+    def _read_raw_sentence(self):
+        """
+        Read one sentence and locate key and value of every word.
+
+        :returns: Reply word, tuple with parsed raw words.
+        """
+        reply_word, words = self.protocol.read_raw_sentence()
+        words = tuple(self.parse_raw_word(word) for word in words)
+        return reply_word, words
+
+    def _read_raw_response(self, response):
+        """
+        Yield sentences until !done is received, or until response is
+        drained by a later command.
+        """
+        while self.raw_response is response:
+            reply_word, words = self._read_raw_sentence()
+            if reply_word == b'!done':
+                self.raw_response = None
+            yield reply_word, words
+
+    def _close_raw_response(self):
+        """
+        Drain last raw response, if it was not read up to !done.
+        """
+        while self.raw_response is not None:
+            reply_word, words = self.protocol.read_raw_sentence()
+            if reply_word == b'!done':
+                self.raw_response = None
+
     def _read_response(self):
         """
         Read until !done is received.
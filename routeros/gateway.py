@@ -0,0 +1,491 @@
+from hmac import compare_digest
+from itertools import count
+from queue import Full, Queue
+from socketserver import BaseRequestHandler, ThreadingTCPServer
+from threading import Condition, Lock, Thread
+from time import monotonic
+
+from routeros.api import Parser
+from routeros.exc import ConnectionError, FatalError, TrapError
+from routeros.utils import API, Socket
+
+TAG = b'.tag='
+# Print arguments that turn a print into a never ending stream,
+# or give it side effects (=file= writes a file on the router).
+UNCACHEABLE = (b'=follow', b'=follow-only', b'=interval', b'=file=')
+
+
+def split_tag(words):
+    """
+    Remove .tag word from given words.
+
+    :param words: Raw words.
+    :returns: Tag value (None if untagged), tuple with remaining words.
+    """
+    tag = None
+    remaining = []
+    for word in words:
+        if word.startswith(TAG):
+            tag = word[len(TAG):]
+        else:
+            remaining.append(word)
+    return tag, tuple(remaining)
+
+
+def parse_attributes(words):
+    """
+    Parse raw attribute words to dict of bytes key, value pairs.
+    """
+    attributes = {}
+    for word in words:
+        view, start, separator = Parser.parse_raw_word(word)
+        attributes[view[start:separator].tobytes()] = view[separator + 1:].tobytes()
+    return attributes
+
+
+def trap(message):
+    """
+    Create !trap sentence words with given message.
+    """
+    return (b'=message=' + message,)
+
+
+class ResponseCache:
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.entries = {}
+        self.purge_at = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def key(command, words):
+        """
+        Return cache key for given command, None if it is not read-only.
+        Words keep their order, queries are stack based.
+        """
+        if not command.endswith(b'/print'):
+            return
+        if any(word.startswith(UNCACHEABLE) for word in words):
+            return
+        return command, tuple(words)
+
+    def get(self, key):
+        with self.lock:
+            expires, sentences = self.entries.get(key, (0, None))
+            if expires < monotonic():
+                self.entries.pop(key, None)
+                return
+            return sentences
+
+    def set(self, key, sentences):
+        """
+        Store sentences for key. Expired entries are purged at most once
+        per timeout, so keys that are never looked up again are dropped.
+        """
+        now = monotonic()
+        with self.lock:
+            if now >= self.purge_at:
+                self.entries = dict(
+                    (key, entry) for key, entry in self.entries.items() if entry[0] >= now
+                )
+                self.purge_at = now + self.timeout
+            self.entries[key] = (now + self.timeout, tuple(sentences))
+
+
+class Pending:
+    def __init__(self, client, tag, cache=None, cache_key=None):
+        """
+        Command forwarded upstream, waiting for !done.
+
+        :param client: GatewayClient to route replies to. None to discard them.
+        :param tag: Tag used by the client.
+        """
+        self.client = client
+        self.tag = tag
+        self.cache = cache
+        self.cache_key = cache_key
+        self.sentences = []
+        self.trapped = False
+        self.session = None
+        self.upstream_tag = None
+
+    def forward(self, reply_word, words):
+        if reply_word == b'!trap':
+            self.trapped = True
+        if self.cache_key is not None:
+            self.sentences.append((reply_word, words))
+        if self.client is not None:
+            self.client.write(reply_word, words, self.tag)
+        if reply_word != b'!done':
+            return
+        if self.client is not None:
+            self.client.finished(self)
+        if self.cache_key is not None and not self.trapped:
+            self.cache.set(self.cache_key, self.sentences)
+
+
+class UpstreamSession:
+    def __init__(self, routeros, tags):
+        """
+        Logged in router session shared by many clients.
+
+        :param routeros: RouterOS returned by login().
+        :param tags: Iterator with unique upstream tags.
+        """
+        self.protocol = routeros.protocol
+        # Session stays idle between commands, reads must not time out.
+        self.protocol.transport.sock.settimeout(None)
+        self.tags = tags
+        self.pending = {}
+        self.lock = Lock()
+        self.alive = True
+        self.reader = Thread(target=self._read_loop)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def send(self, pending, command, *words):
+        """
+        Write command with a rewritten .tag and register it for replies.
+
+        :throws ConnectionError: If session is closed or write fails.
+        """
+        with self.lock:
+            if not self.alive:
+                raise ConnectionError('Upstream session is closed.')
+            tag = str(next(self.tags)).encode('ascii')
+            pending.session, pending.upstream_tag = self, tag
+            self.pending[tag] = pending
+            if pending.client is not None:
+                pending.client.started(pending)
+            try:
+                self.protocol.write_raw_sentence(command, *(words + (TAG + tag,)))
+            except ConnectionError:
+                self.pending.pop(tag)
+                self.alive = False
+                raise
+
+    def cancel(self, tag):
+        """
+        Cancel command with given upstream tag, discarding its replies.
+        """
+        try:
+            self.send(Pending(client=None, tag=None), b'/cancel', b'=tag=' + tag)
+        except ConnectionError:
+            pass
+
+    def _read_loop(self):
+        try:
+            while True:
+                reply_word, words = self.protocol.read_raw_sentence()
+                tag, words = split_tag(words)
+                with self.lock:
+                    if reply_word == b'!done':
+                        pending = self.pending.pop(tag, None)
+                    else:
+                        pending = self.pending.get(tag)
+                if pending is not None:
+                    pending.forward(reply_word, words)
+        except (ConnectionError, FatalError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Close session, failing every command still waiting for replies.
+        """
+        with self.lock:
+            self.alive = False
+            pending, self.pending = self.pending, {}
+        self.protocol.close()
+        for command in pending.values():
+            command.forward(b'!trap', trap(b'connection to router lost'))
+            command.forward(b'!done', ())
+
+
+class GatewayClient:
+    # Replies queued for a client that stopped reading before it is dropped.
+    queue_size = 10000
+    # Seconds to wait for queued replies to be written once client is closed.
+    flush_timeout = 10
+
+    def __init__(self, gateway, protocol):
+        """
+        Local client connection speaking RouterOS API.
+        Replies are written by a writer thread of its own, so upstream
+        sessions never wait on a slow client.
+
+        :param gateway: Gateway serving this client.
+        :param protocol: API wrapping client connection.
+        """
+        self.gateway = gateway
+        self.protocol = protocol
+        self.authenticated = gateway.users is None
+        self.pending = {}
+        self.lock = Lock()
+        self.closed = False
+        self.outbound = Queue(maxsize=self.queue_size)
+        self.writer = Thread(target=self._write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+        gateway.register(self)
+
+    def serve(self):
+        """
+        Read and dispatch commands until connection is closed, then wait
+        for queued replies to be written.
+        """
+        try:
+            while not self.closed:
+                command, words = self.protocol.read_raw_sentence()
+                tag, words = split_tag(words)
+                self.dispatch(tag, command, words)
+        except (ConnectionError, FatalError):
+            pass
+        finally:
+            self.close()
+            self.writer.join(self.flush_timeout)
+
+    def dispatch(self, tag, command, words):
+        if command == b'/login':
+            self.login(tag, words)
+        elif not self.authenticated:
+            self.write(b'!trap', trap(b'not logged in'), tag)
+            self.write(b'!done', (), tag)
+        elif command == b'/quit':
+            self.write(b'!fatal', (b'session terminated on request',), tag)
+            self.close()
+        elif command == b'/cancel':
+            self.cancel(tag, words)
+        else:
+            self.gateway.execute(self, tag, command, words)
+
+    def login(self, tag, words):
+        attributes = parse_attributes(words)
+        if self.gateway.users is not None:
+            expected = self.gateway.users.get(attributes.get(b'name'))
+            password = attributes.get(b'password', b'')
+            if expected is None or not compare_digest(password, expected):
+                self.write(b'!trap', trap(b'invalid user name or password (6)'), tag)
+                self.write(b'!done', (), tag)
+                return
+        self.authenticated = True
+        self.write(b'!done', (), tag)
+
+    def cancel(self, tag, words):
+        attributes = parse_attributes(words)
+        with self.lock:
+            commands = [command for command in self.pending.values()
+                        if b'tag' not in attributes or command.tag == attributes[b'tag']]
+        for command in commands:
+            command.session.cancel(command.upstream_tag)
+        self.write(b'!done', (), tag)
+
+    def started(self, pending):
+        # Keyed by upstream tag, client tags may repeat or be missing.
+        with self.lock:
+            self.pending[pending.upstream_tag] = pending
+
+    def finished(self, pending):
+        with self.lock:
+            self.pending.pop(pending.upstream_tag, None)
+
+    def write(self, reply_word, words, tag):
+        """
+        Queue reply sentence for client, tagged with the client's own tag.
+        A client too slow to keep up with its replies is dropped.
+        """
+        if tag is not None:
+            words = tuple(words) + (TAG + tag,)
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self.outbound.put_nowait((reply_word,) + tuple(words))
+                return
+            except Full:
+                pass
+        self.close()
+
+    def _write_loop(self):
+        try:
+            for sentence in iter(self.outbound.get, None):
+                self.protocol.write_raw_sentence(*sentence)
+        except ConnectionError:
+            pass
+        finally:
+            self.close()
+            self.protocol.close()
+
+    def close(self):
+        """
+        Stop accepting replies and cancel every command still running upstream.
+        Connection is closed by the writer, once queued replies are written.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending, self.pending = self.pending, {}
+            try:
+                self.outbound.put_nowait(None)
+            except Full:
+                # Writer is stuck on a client that stopped reading.
+                self.protocol.close()
+        self.gateway.unregister(self)
+        for command in pending.values():
+            command.session.cancel(command.upstream_tag)
+
+
+class GatewayHandler(BaseRequestHandler):
+    def handle(self):
+        protocol = API(transport=Socket(sock=self.request), encoding='ASCII')
+        GatewayClient(self.server.gateway, protocol).serve()
+
+
+class GatewayServer(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, gateway, address):
+        self.gateway = gateway
+        ThreadingTCPServer.__init__(self, address, GatewayHandler)
+
+
+class Gateway:
+    def __init__(self, connect, sessions=2, users=None, cache_timeout=None):
+        """
+        RouterOS API gateway multiplexing local clients onto few router sessions.
+
+        :param connect: Callable returning a logged in RouterOS. eg. partial(login, ...)
+        :param sessions: Maximum number of upstream sessions.
+        :param users: Dictionary with local username, password (UTF-8 on the wire).
+                      None accepts any login.
+        :param cache_timeout: Seconds to cache read-only prints. None disables caching.
+        """
+        self.connect = connect
+        self.size = sessions
+        if users is not None:
+            users = dict((name.encode('utf-8'), password.encode('utf-8'))
+                         for name, password in users.items())
+        self.users = users
+        self.cache = ResponseCache(cache_timeout) if cache_timeout else None
+        self.sessions = []
+        self.opening = 0
+        self.clients = set()
+        self.closed = False
+        self.tags = count()
+        self.lock = Condition()
+        self.server = None
+
+    def listen(self, host='127.0.0.1', port=8728):
+        """
+        Bind gateway to given address.
+
+        :returns: Bound host, port.
+        """
+        self.server = GatewayServer(self, (host, port))
+        return self.server.server_address
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        """
+        Serve clients on a background thread.
+        """
+        thread = Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def register(self, client):
+        """
+        Track client, closing it right away if gateway is closed.
+        """
+        with self.lock:
+            if not self.closed:
+                self.clients.add(client)
+                return
+        client.close()
+
+    def unregister(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def session(self):
+        """
+        Return least busy upstream session, opening a new one only when
+        every open session is busy. Sessions are opened without holding
+        the lock, so a slow login does not hold back other clients.
+
+        :throws ConnectionError: If gateway is closed.
+        """
+        with self.lock:
+            while True:
+                if self.closed:
+                    raise ConnectionError('Gateway is closed.')
+                self.sessions = [session for session in self.sessions if session.alive]
+                idle = [session for session in self.sessions if not session.pending]
+                if idle:
+                    return idle[0]
+                if len(self.sessions) + self.opening < self.size:
+                    self.opening += 1
+                    break
+                if self.sessions:
+                    return min(self.sessions, key=lambda session: len(session.pending))
+                # Every slot is being opened, wait for one of them.
+                self.lock.wait()
+
+        session = None
+        try:
+            session = UpstreamSession(self.connect(), self.tags)
+        finally:
+            with self.lock:
+                self.opening -= 1
+                closed = self.closed
+                if session is not None and not closed:
+                    self.sessions.append(session)
+                self.lock.notify_all()
+        if closed:
+            # Gateway was closed while this session was being opened.
+            session.close()
+            raise ConnectionError('Gateway is closed.')
+        return session
+
+    def execute(self, client, tag, command, words):
+        """
+        Forward command upstream, or replay it from cache.
+        """
+        cache_key = self.cache.key(command, words) if self.cache else None
+        if cache_key is not None:
+            sentences = self.cache.get(cache_key)
+            if sentences is not None:
+                for reply_word, reply_words in sentences:
+                    client.write(reply_word, reply_words, tag)
+                return
+
+        pending = Pending(client, tag, self.cache, cache_key)
+        try:
+            self.session().send(pending, command, *words)
+        except (ConnectionError, FatalError, TrapError):
+            client.finished(pending)
+            client.write(b'!trap', trap(b'unable to reach router'), tag)
+            client.write(b'!done', (), tag)
+
+    def close(self):
+        """
+        Stop listening, then close every client and upstream session.
+        """
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        with self.lock:
+            clients, self.clients = self.clients, set()
+            sessions, self.sessions = self.sessions, []
+        for client in clients:
+            client.close()
+        for session in sessions:
+            session.close()
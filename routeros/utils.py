@@ -101,6 +101,19 @@ class APIUtils:
         encoded += b'\x00'
         return encoded
 
+    def encode_raw_sentence(self, *words):
+        """
+        Encode given sentence of already encoded words in API format.
+
+        :param words: Words (bytes) to encode.
+        :returns: Encoded sentence.
+        """
+        encoded = [self.encode_length(len(word)) + word for word in words]
+        encoded = b''.join(encoded)
+        # append EOS (end of sentence) byte
+        encoded += b'\x00'
+        return encoded
+
     @staticmethod
     def decode_bytes(bytes):
         """
@@ -185,6 +198,16 @@ class API(APIUtils):
         encoded = self.encode_sentence(self.encoding, command, *words)
         self.transport.write(encoded)
 
+    def write_raw_sentence(self, command, *words):
+        """
+        Write sentence of already encoded words.
+
+        :param command: Command word (bytes).
+        :param words: Parameter words (bytes).
+        """
+        encoded = self.encode_raw_sentence(command, *words)
+        self.transport.write(encoded)
+
     def read_sentence(self):
         """
         Read every word until empty word (NULL byte) is received.
@@ -199,16 +222,58 @@ class API(APIUtils):
         else:
             return reply_word, words
 
+    def read_raw_sentence(self):
+        """
+        Read every word until empty word (NULL byte) is received.
+        Words are returned as received, without being decoded.
+        Empty sentences are skipped.
+
+        :return: Reply word, tuple with read words (bytes).
+        """
+        sentence = ()
+        while not sentence:
+            sentence = tuple(word for word in iter(self.read_raw_word, None))
+        reply_word, words = sentence[0], sentence[1:]
+        if reply_word == b'!fatal':
+            self.transport.close()
+            raise FatalError(words[0].decode(encoding=self.encoding, errors='replace'))
+        else:
+            return reply_word, words
+
     def read_word(self):
+        word = self.read_raw_word()
+        if word is None:
+            return
+        return word.decode(encoding=self.encoding, errors='strict')
+
+    def read_raw_word(self):
         bytes = self.transport.read(1)
         read = self.determine_length(bytes)
         if read:
-            bytes += self.transport.read(read)
+            bytes += self.read_exactly(read)
 
         bytes = self.decode_bytes(bytes)
         if not bytes:
             return
-        return self.transport.read(bytes).decode(encoding=self.encoding, errors='strict')
+        return self.read_exactly(bytes)
+
+    def read_exactly(self, length):
+        """
+        Read until length bytes are received, transport may return less.
+
+        :param length: length to read.
+        :return: bytes read.
+        """
+        data = self.transport.read(length)
+        if len(data) == length:
+            return data
+        chunks = [data]
+        length -= len(data)
+        while length:
+            data = self.transport.read(length)
+            chunks.append(data)
+            length -= len(data)
+        return b''.join(chunks)
 
     def close(self):
         self.transport.close()
@@ -1,6 +1,9 @@
+import json
 import unittest
+from unittest.mock import Mock
 
-from routeros.api import Query, Parser
+from routeros.api import Query, Parser, RouterOS
+from routeros.exc import TrapError
 
 
 class MockedAPI:
@@ -66,3 +69,95 @@ class TestParser(unittest.TestCase):
         for attribute in self.attributes:
             attr = Parser.compose_word(attribute['key'], attribute['value'])
             self.assertEqual(attribute['attr'], attr)
+
+    def test_parse_raw_word(self):
+        for attribute in self.attributes:
+            view, start, separator = Parser.parse_raw_word(attribute['attr'].encode())
+            self.assertIsInstance(view, memoryview)
+            self.assertEqual(view[start:separator].tobytes(), attribute['key'].encode())
+            self.assertEqual(view[separator + 1:].tobytes(), attribute['value'].encode())
+
+    def test_parse_raw_word_without_leading_equal(self):
+        view, start, separator = Parser.parse_raw_word(b'.tag=3')
+        self.assertEqual(view[start:separator].tobytes(), b'.tag')
+        self.assertEqual(view[separator + 1:].tobytes(), b'3')
+
+    def test_dump_json_line(self):
+        words = [Parser.parse_raw_word(attribute['attr'].encode())
+                 for attribute in self.attributes]
+        line = Parser.dump_json_line(words)
+        self.assertEqual(line[-1:], b'\n')
+        self.assertEqual(json.loads(line.decode('ascii')),
+                         {'.id': 'value', 'name': 'ether1', 'comment': ''})
+
+    def test_dump_json_line_escapes(self):
+        words = [Parser.parse_raw_word(b'=comment=a"b\\c\n')]
+        line = Parser.dump_json_line(words)
+        self.assertEqual(json.loads(line.decode('ascii')), {'comment': 'a"b\\c\n'})
+
+    def test_dump_json_line_transcodes_to_utf8(self):
+        expected = {'comment': b'\xc5\x82'.decode('utf-8')}
+        for encoding, word in (('utf-8', b'=comment=\xc5\x82'), ('cp1250', b'=comment=\xb3')):
+            line = Parser.dump_json_line([Parser.parse_raw_word(word)], encoding)
+            self.assertEqual(json.loads(line.decode('utf-8')), expected)
+
+    def test_dump_json_line_raises_on_invalid_encoding(self):
+        words = [Parser.parse_raw_word(b'=comment=\xc5\x82')]
+        with self.assertRaises(UnicodeDecodeError):
+            Parser.dump_json_line(words, 'ASCII')
+
+
+class TestRouterOSRaw(unittest.TestCase):
+    def setUp(self):
+        self.protocol = Mock()
+        self.protocol.encoding = 'ASCII'
+        self.protocol.read_raw_sentence.side_effect = [
+            (b'!re', (b'=.id=*1', b'=name=dhcp')),
+            (b'!re', (b'=.id=*2', b'=name=pool')),
+            (b'!done', ()),
+        ]
+        self.routeros = RouterOS(protocol=self.protocol)
+
+    def test_raw(self):
+        response = list(self.routeros.raw('/ip/pool/print'))
+        self.protocol.write_sentence.assert_called_once_with('/ip/pool/print')
+        self.assertEqual([reply_word for reply_word, words in response],
+                         [b'!re', b'!re', b'!done'])
+        view, start, separator = response[0][1][1]
+        self.assertEqual(view[separator + 1:].tobytes(), b'dhcp')
+
+    def test_raw_json(self):
+        lines = list(self.routeros.raw_json('/ip/pool/print'))
+        self.assertEqual(lines, [b'{".id":"*1","name":"dhcp"}\n',
+                                 b'{".id":"*2","name":"pool"}\n'])
+
+    def test_raw_json_raises_on_trap(self):
+        self.protocol.read_raw_sentence.side_effect = [
+            (b'!trap', (b'=message=no such command',)),
+            (b'!done', ()),
+        ]
+        with self.assertRaises(TrapError) as context:
+            list(self.routeros.raw_json('/ip/pool/foo'))
+        self.assertEqual(str(context.exception), 'no such command')
+        self.assertEqual(self.protocol.read_raw_sentence.call_count, 2)
+
+    def test_raw_drains_never_iterated_response(self):
+        self.routeros.raw('/ip/pool/print')
+        self.protocol.read_sentence.return_value = ('!done', ())
+        self.routeros('/ip/pool/print')
+        self.assertEqual(self.protocol.read_raw_sentence.call_count, 3)
+
+    def test_drained_response_stops(self):
+        response = self.routeros.raw('/ip/pool/print')
+        next(response)
+        self.protocol.read_sentence.return_value = ('!done', ())
+        self.routeros('/ip/pool/print')
+        self.assertEqual(list(response), [])
+        self.assertEqual(self.protocol.read_raw_sentence.call_count, 3)
+
+    def test_raw_drains_before_next_command(self):
+        response = self.routeros.raw('/ip/pool/print')
+        next(response)
+        self.protocol.read_sentence.return_value = ('!done', ())
+        self.routeros('/ip/pool/print')
+        self.assertEqual(self.protocol.read_raw_sentence.call_count, 3)
@@ -0,0 +1,371 @@
+import unittest
+from functools import partial
+from socket import create_connection
+from socketserver import BaseRequestHandler, ThreadingTCPServer
+from threading import Event, Lock, Thread
+from unittest.mock import Mock, patch
+
+from routeros import login
+from routeros.gateway import (
+    Gateway, GatewayClient, Pending, ResponseCache, UpstreamSession, split_tag
+)
+from routeros.utils import API, Socket
+from routeros.exc import ConnectionError
+
+
+class FakeRouterHandler(BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        protocol = API(transport=Socket(sock=self.request), encoding='ASCII')
+        try:
+            while True:
+                command, words = protocol.read_sentence()
+                tag = tuple(word for word in words if word.startswith('.tag='))
+                if command == '/login':
+                    with server.lock:
+                        server.logins += 1
+                elif command == '/ip/pool/print':
+                    with server.lock:
+                        server.prints += 1
+                    for pool in server.pools:
+                        protocol.write_sentence('!re', *(pool + tag))
+                elif command == '/flood':
+                    for _ in range(2000):
+                        protocol.write_sentence('!re', '=data=' + 'x' * 1000, *tag)
+                elif command == '/listen':
+                    # Never ending command, only stopped by /cancel.
+                    protocol.write_sentence('!re', '=event=started', *tag)
+                    continue
+                elif command == '/cancel':
+                    cancelled = [word[len('=tag='):] for word in words if word.startswith('=tag=')]
+                    with server.lock:
+                        server.cancelled.extend(cancelled)
+                    for cancel in cancelled:
+                        protocol.write_sentence('!trap', '=message=interrupted', '.tag=' + cancel)
+                        protocol.write_sentence('!done', '.tag=' + cancel)
+                else:
+                    protocol.write_sentence('!trap', '=message=no such command', *tag)
+                protocol.write_sentence('!done', *tag)
+        except ConnectionError:
+            pass
+
+
+class FakeRouter(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    pools = (
+        ('=.id=*1', '=name=dhcp'),
+        ('=.id=*2', '=name=hs-pool-8'),
+    )
+
+    def __init__(self):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), FakeRouterHandler)
+        self.lock = Lock()
+        self.logins = 0
+        self.prints = 0
+        self.cancelled = []
+        thread = Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class TestGateway(unittest.TestCase):
+    expected = ({'.id': '*1', 'name': 'dhcp'}, {'.id': '*2', 'name': 'hs-pool-8'})
+
+    def setUp(self):
+        self.router = FakeRouter()
+        host, port = self.router.server_address
+        self.connect = partial(login, 'admin', 'secret', host, port)
+
+    def tearDown(self):
+        self.router.close()
+
+    def start(self, **kwargs):
+        self.gateway = Gateway(self.connect, **kwargs)
+        self.addCleanup(self.gateway.close)
+        self.address = self.gateway.listen('127.0.0.1', 0)
+        self.gateway.start()
+
+    def raw_client(self):
+        protocol = API(transport=Socket(sock=create_connection(self.address, timeout=10)),
+                       encoding='ASCII')
+        self.addCleanup(protocol.close)
+        return protocol
+
+    def test_many_clients_share_few_sessions(self):
+        self.start(sessions=2)
+        results = []
+
+        def client():
+            routeros = login('tool', 'password', *self.address)
+            for _ in range(5):
+                results.append(routeros('/ip/pool/print'))
+            routeros.close()
+
+        threads = [Thread(target=client) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 100)
+        self.assertTrue(all(result == self.expected for result in results))
+        self.assertLessEqual(self.router.logins, 2)
+        self.assertEqual(self.router.prints, 100)
+
+    def test_client_tags_are_restored(self):
+        self.start()
+        client = self.raw_client()
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+        self.assertEqual(client.read_raw_sentence(), (b'!done', ()))
+
+        client.write_raw_sentence(b'/ip/pool/print', b'.tag=a')
+        client.write_raw_sentence(b'/ip/pool/print', b'.tag=b')
+        replies = [client.read_raw_sentence() for _ in range(6)]
+        for tag in (b'a', b'b'):
+            tagged = [reply_word for reply_word, words in replies if split_tag(words)[0] == tag]
+            self.assertEqual(tagged, [b'!re', b'!re', b'!done'])
+
+    def test_read_only_prints_are_cached(self):
+        self.start(cache_timeout=60)
+        routeros = login('tool', 'password', *self.address)
+        self.addCleanup(routeros.close)
+        self.assertEqual(routeros('/ip/pool/print'), self.expected)
+        self.assertEqual(routeros('/ip/pool/print'), self.expected)
+        self.assertEqual(self.router.prints, 1)
+
+    def test_queries_in_different_order_are_cached_apart(self):
+        self.start(cache_timeout=60)
+        routeros = login('tool', 'password', *self.address)
+        self.addCleanup(routeros.close)
+        routeros('/ip/pool/print', '?name=dhcp', '?.id=*1', '?#|', '?#!')
+        routeros('/ip/pool/print', '?name=dhcp', '?.id=*1', '?#!', '?#|')
+        self.assertEqual(self.router.prints, 2)
+
+    def test_closed_client_cancels_running_commands(self):
+        self.start()
+        client = self.raw_client()
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+        client.read_raw_sentence()
+        client.write_raw_sentence(b'/listen', b'.tag=7')
+        self.assertEqual(client.read_raw_sentence(), (b'!re', (b'=event=started', b'.tag=7')))
+        client.close()
+
+        session = self.gateway.sessions[0]
+        for _ in range(50):
+            if not session.pending:
+                break
+            session.reader.join(0.1)
+        self.assertEqual(session.pending, {})
+        self.assertEqual(len(self.router.cancelled), 1)
+
+    def test_closed_client_cancels_every_untagged_command(self):
+        self.start(sessions=1)
+        client = self.raw_client()
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+        client.read_raw_sentence()
+        for _ in range(2):
+            client.write_raw_sentence(b'/listen')
+            client.read_raw_sentence()
+        client.close()
+
+        session = self.gateway.sessions[0]
+        for _ in range(50):
+            if not session.pending:
+                break
+            session.reader.join(0.1)
+        self.assertEqual(session.pending, {})
+        self.assertEqual(len(self.router.cancelled), 2)
+
+    def test_cancel_without_tag_cancels_every_command(self):
+        self.start(sessions=1)
+        client = self.raw_client()
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+        client.read_raw_sentence()
+        for _ in range(2):
+            client.write_raw_sentence(b'/listen', b'.tag=1')
+            client.read_raw_sentence()
+        client.write_raw_sentence(b'/cancel', b'.tag=2')
+        replies = [client.read_raw_sentence() for _ in range(5)]
+        self.assertEqual(sorted(reply_word for reply_word, words in replies),
+                         [b'!done', b'!done', b'!done', b'!trap', b'!trap'])
+        self.assertEqual(len(self.router.cancelled), 2)
+
+    def test_stalled_client_does_not_block_others(self):
+        self.start(sessions=1)
+        with patch.object(GatewayClient, 'queue_size', 10):
+            stalled = self.raw_client()
+            stalled.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+            stalled.read_raw_sentence()
+            # Never read replies of this one.
+            stalled.write_raw_sentence(b'/flood', b'.tag=1')
+
+            routeros = login('tool', 'password', *self.address)
+            self.addCleanup(routeros.close)
+            for _ in range(5):
+                self.assertEqual(routeros('/ip/pool/print'), self.expected)
+        self.assertEqual(len(self.gateway.sessions), 1)
+
+        # Stalled client was dropped before getting every reply.
+        received = 0
+        with self.assertRaises(ConnectionError):
+            while True:
+                stalled.read_raw_sentence()
+                received += 1
+        self.assertLess(received, 2000)
+
+    def test_close_closes_accepted_clients(self):
+        self.start()
+        client = self.raw_client()
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+        client.read_raw_sentence()
+        client.write_raw_sentence(b'/ip/pool/print')
+        for _ in range(3):
+            client.read_raw_sentence()
+        self.gateway.close()
+
+        with self.assertRaises(ConnectionError):
+            client.write_raw_sentence(b'/ip/pool/print')
+            client.read_raw_sentence()
+        self.assertEqual(self.gateway.sessions, [])
+        self.assertEqual(self.gateway.clients, set())
+        self.assertEqual(self.router.logins, 1)
+
+    def test_empty_sentences_are_ignored(self):
+        self.start()
+        client = self.raw_client()
+        client.transport.write(b'\x00')
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+        self.assertEqual(client.read_raw_sentence(), (b'!done', ()))
+
+    def test_login_is_checked_against_users(self):
+        self.start(users={'tool': 'password'})
+        client = self.raw_client()
+        client.write_raw_sentence(b'/ip/pool/print')
+        self.assertEqual(client.read_raw_sentence(), (b'!trap', (b'=message=not logged in',)))
+        client.read_raw_sentence()
+
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=wrong')
+        reply_word, words = client.read_raw_sentence()
+        self.assertEqual(reply_word, b'!trap')
+        client.read_raw_sentence()
+
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=password')
+        self.assertEqual(client.read_raw_sentence(), (b'!done', ()))
+        self.assertEqual(self.router.logins, 0)
+
+    def test_login_with_non_ascii_password(self):
+        password = b'\xc5\x82\xc4\x85'.decode('utf-8')
+        self.start(users={'tool': password})
+        client = self.raw_client()
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=' + password.encode('utf-8'))
+        self.assertEqual(client.read_raw_sentence(), (b'!done', ()))
+
+    def test_unreachable_router_traps(self):
+        self.start()
+        self.router.close()
+        self.gateway.connect = partial(login, 'admin', 'secret', '127.0.0.1', 1)
+        client = self.raw_client()
+        client.write_raw_sentence(b'/login', b'=name=tool', b'=password=x')
+        client.read_raw_sentence()
+        client.write_raw_sentence(b'/ip/pool/print', b'.tag=1')
+        self.assertEqual(client.read_raw_sentence()[0], b'!trap')
+        self.assertEqual(client.read_raw_sentence(), (b'!done', (b'.tag=1',)))
+
+
+class TestGatewaySession(unittest.TestCase):
+    def test_connect_does_not_hold_lock(self):
+        release = Event()
+        routeros = Mock()
+        routeros.protocol.read_raw_sentence.side_effect = ConnectionError
+
+        def connect():
+            release.wait(1)
+            return routeros
+
+        gateway = Gateway(connect, sessions=1)
+        opener = Thread(target=gateway.session)
+        opener.start()
+        for _ in range(50):
+            if gateway.opening:
+                break
+            opener.join(0.01)
+        # Lock is free while the only session is being opened.
+        self.assertTrue(gateway.lock.acquire(timeout=1))
+        gateway.lock.release()
+        release.set()
+        opener.join(1)
+        self.assertEqual(gateway.opening, 0)
+
+    def test_closed_gateway_opens_no_session(self):
+        connect = Mock()
+        gateway = Gateway(connect)
+        gateway.close()
+        with self.assertRaises(ConnectionError):
+            gateway.session()
+        self.assertEqual(connect.call_count, 0)
+
+    def test_failed_connect_releases_slot(self):
+        gateway = Gateway(Mock(side_effect=ConnectionError), sessions=1)
+        with self.assertRaises(ConnectionError):
+            gateway.session()
+        self.assertEqual(gateway.opening, 0)
+
+
+class TestUpstreamSession(unittest.TestCase):
+    def test_unexpected_error_closes_session(self):
+        release = Event()
+
+        def read_raw_sentence():
+            release.wait(1)
+            raise ValueError
+
+        routeros = Mock()
+        routeros.protocol.read_raw_sentence.side_effect = read_raw_sentence
+        client = Mock()
+        with patch('threading.excepthook'):
+            session = UpstreamSession(routeros, iter(range(10)))
+            session.send(Pending(client, b'1'), b'/ip/pool/print')
+            release.set()
+            session.reader.join(1)
+
+        self.assertFalse(session.alive)
+        routeros.protocol.close.assert_called_with()
+        replies = [call[0][0] for call in client.write.call_args_list]
+        self.assertEqual(replies, [b'!trap', b'!done'])
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_key(self):
+        self.assertIsNotNone(ResponseCache.key(b'/ip/pool/print', (b'?name=dhcp',)))
+        self.assertIsNone(ResponseCache.key(b'/ip/pool/add', (b'=name=dhcp',)))
+        self.assertIsNone(ResponseCache.key(b'/interface/print', (b'=follow=',)))
+        self.assertIsNone(ResponseCache.key(b'/ip/address/print', (b'=file=addresses',)))
+
+    def test_key_keeps_query_order(self):
+        first = ResponseCache.key(b'/ip/pool/print', (b'?a', b'?b', b'?#|', b'?#!'))
+        second = ResponseCache.key(b'/ip/pool/print', (b'?a', b'?b', b'?#!', b'?#|'))
+        self.assertNotEqual(first, second)
+
+    def test_expired_entries_are_dropped(self):
+        cache = ResponseCache(timeout=-1)
+        cache.set(b'key', [(b'!done', ())])
+        self.assertIsNone(cache.get(b'key'))
+
+    def test_set_purges_expired_entries(self):
+        cache = ResponseCache(timeout=60)
+        with patch('routeros.gateway.monotonic', return_value=0):
+            cache.set(b'first', [(b'!done', ())])
+        with patch('routeros.gateway.monotonic', return_value=100):
+            cache.set(b'second', [(b'!done', ())])
+        self.assertEqual(list(cache.entries), [b'second'])
+
+
+class TestSplitTag(unittest.TestCase):
+    def test_split_tag(self):
+        self.assertEqual(split_tag((b'=a=b', b'.tag=3')), (b'3', (b'=a=b',)))
+        self.assertEqual(split_tag((b'=a=b',)), (None, (b'=a=b',)))
@@ -168,6 +168,37 @@ class TestAPI(unittest.TestCase):
                 self.api.read_sentence()
             self.assertEqual(self.api.transport.close.call_count, 1)
 
+    def test_read_raw_word_returns_bytes(self):
+        self.api.transport.read.side_effect = [b'\x06', b'=a=b\xc5\x82']
+        self.assertEqual(self.api.read_raw_word(), b'=a=b\xc5\x82')
+
+    def test_read_raw_word_reads_until_complete(self):
+        self.api.transport.read.side_effect = [b'\x80', b'\x82', b'x' * 100, b'x' * 30]
+        self.assertEqual(self.api.read_raw_word(), b'x' * 130)
+        self.api.transport.read.assert_called_with(30)
+
+    def test_read_raw_word_returns_none_on_empty_word(self):
+        self.api.transport.read.return_value = b'\x00'
+        self.assertIsNone(self.api.read_raw_word())
+
+    def test_read_word_decodes_raw_word(self):
+        self.api.transport.read.side_effect = [b'\x03', b'!re']
+        self.assertEqual(self.api.read_word(), '!re')
+
+    def test_read_raw_sentence(self):
+        self.api.transport.read.side_effect = [b'\x03', b'!re', b'\x04', b'=a=b', b'\x00']
+        self.assertEqual(self.api.read_raw_sentence(), (b'!re', (b'=a=b',)))
+
+    def test_read_raw_sentence_skips_empty_sentences(self):
+        self.api.transport.read.side_effect = [b'\x00', b'\x03', b'!re', b'\x00']
+        self.assertEqual(self.api.read_raw_sentence(), (b'!re', ()))
+
+    def test_read_raw_sentence_raises_FatalError(self):
+        with patch('routeros.utils.iter', return_value=(b'!fatal', b'reason')):
+            with self.assertRaises(FatalError):
+                self.api.read_raw_sentence()
+            self.assertEqual(self.api.transport.close.call_count, 1)
+
     def test_close(self):
         self.api.close()
         self.api.transport.close.assert_called_once_with()